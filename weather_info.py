@@ -1,18 +1,29 @@
-import argparse
-import csv
+import atexit
+import bisect
 import datetime
+import itertools
+import json
+import operator
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from types import SimpleNamespace
 import os
-from pathlib import Path
-import requests
 
 # 定数
 LATITUDE = 35.681236  # 東京駅の緯度
 LONGITUDE = 139.767125  # 東京駅の経度
-TODAY = datetime.date.today()
-TWO_WEEKS_AGO = TODAY - datetime.timedelta(days=13)  # 2週間
-FOUR_MONTHS_AGO = TODAY - datetime.timedelta(days=124)  # 4ヶ月以内
+TWO_WEEKS_DAYS = 13  # 2週間
+FOUR_MONTHS_DAYS = 124  # 4ヶ月以内
+
+# 日付の定数は参照時に計算 (TODAY, TWO_WEEKS_AGO, FOUR_MONTHS_AGO)
+def __getattr__(name):
+    if name == "TODAY":
+        return datetime.date.today()
+    if name == "TWO_WEEKS_AGO":
+        return datetime.date.today() - datetime.timedelta(days=TWO_WEEKS_DAYS)
+    if name == "FOUR_MONTHS_AGO":
+        return datetime.date.today() - datetime.timedelta(days=FOUR_MONTHS_DAYS)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # API関連の定数
 API_URL = "https://api.open-meteo.com/v1/forecast"
@@ -22,6 +33,16 @@ API_PARAMS = {
     "hourly": "temperature_2m,precipitation,windspeed_10m,weathercode",
     "timezone": "Asia/Tokyo"
 }
+API_TIMEOUT = (3.05, 10)  # (接続, 読み込み) タイムアウト秒数
+API_POOL_CONNECTIONS = 4  # 接続を保持するホスト数の上限
+API_MAX_CONNECTIONS = 10  # 同時に使用する接続数の上限
+
+# API接続を使い回すためのセッション (初回のAPIリクエスト時に作成)
+_SESSION = None
+
+# APIレスポンスのキャッシュ
+CACHE_DIR = os.path.join("~", ".cache", "weather_info")
+CACHE_TTL = 3600  # 本日を含む期間のキャッシュ有効期限(秒)
 
 # CSVヘッダーの日本語訳
 HEADER_TRANSLATION = {
@@ -32,19 +53,76 @@ HEADER_TRANSLATION = {
     "precipitation": "降水量(mm)",
     "windspeed_10m": "最大風速(m/s)"
 }
+# CSV出力時のデフォルトのカラム (HEADER_TRANSLATIONの定義順)
+DEFAULT_CSV_COLUMNS = list(HEADER_TRANSLATION)
+CSV_BUFFER_SIZE = 1024 * 1024  # CSV書き込み時のバッファサイズ(1MiB)
+
+# API接続用のセッションを取得 (requestsは必要になるまで読み込まない)
+def get_session():
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        _SESSION = requests.Session()
+        _SESSION.mount("https://", HTTPAdapter(pool_connections=API_POOL_CONNECTIONS, pool_maxsize=API_MAX_CONNECTIONS))
+        _SESSION.headers["User-Agent"] = "weather_info"
+        atexit.register(_SESSION.close)
+    return _SESSION
+
+# キャッシュから天気データを読み込み
+# (end_dateの翌日以降に取得したデータは無期限、それ以外はCACHE_TTLまで有効)
+def load_cached_data(cache_file: str, end_date: str) -> Optional[Dict[str, Any]]:
+    try:
+        fetched_at = os.stat(cache_file).st_mtime
+        if datetime.date.fromtimestamp(fetched_at).isoformat() <= end_date:
+            age = datetime.datetime.now().timestamp() - fetched_at
+            if age > CACHE_TTL:
+                return None
+        with open(cache_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# 天気データをキャッシュに保存 (一時ファイルに書き込んでから置き換え、保存できなくても処理は続行)
+def save_cached_data(cache_file: str, data: Dict[str, Any]):
+    import tempfile
+
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
 
 # Open-Meteo APIから天気データを取得
 def get_weather_data(latitude: float, longitude: float, start_date: str, end_date: str) -> Dict[str, Any]:
+    cache_file = os.path.join(os.path.expanduser(CACHE_DIR), f"{latitude}_{longitude}_{start_date}_{end_date}.json")
+    cached_data = load_cached_data(cache_file, end_date)
+    if cached_data is not None:
+        return cached_data
+
     params = API_PARAMS.copy()
     params.update({
         "start_date": start_date,
         "end_date": end_date
     })
+    import requests
+
     # APIリクエストでのエラー
     try:
-        response = requests.get(API_URL, params=params)
+        response = get_session().get(API_URL, params=params, timeout=API_TIMEOUT)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.ConnectionError:
         print("ネットワーク接続エラー: APIサーバーに接続できません。")
         return None
@@ -58,8 +136,19 @@ def get_weather_data(latitude: float, longitude: float, start_date: str, end_dat
         print(f"APIリクエストエラー: {e}")
         return None
 
+    save_cached_data(cache_file, data)
+    return data
+
 # コマンドライン引数を解析
-def parse_args() -> argparse.Namespace:
+def parse_args():
+    # 日付と--csvのみの場合はargparseを読み込まずに解析 (起動時間の短縮)
+    argv = sys.argv[1:]
+    positionals = [arg for arg in argv if not arg.startswith("-")]
+    if len(positionals) <= 1 and all(arg == "--csv" or not arg.startswith("-") for arg in argv):
+        return SimpleNamespace(date=positionals[0] if positionals else None,
+                               csv="--csv" in argv, columns=None)
+
+    import argparse
     parser = argparse.ArgumentParser(description="天気情報アプリ")
     parser.add_argument("date", nargs="?", help="指定日の天気情報を表示 (YYYY-MM-DD形式)")
     parser.add_argument("--csv", action="store_true", help="CSV形式で出力")
@@ -68,77 +157,79 @@ def parse_args() -> argparse.Namespace:
 
 # 天気データを処理し、必要な情報を抽出
 def process_weather_data(data: Dict[str, Any], end_date: datetime.date) -> List[Dict[str, Any]]:
-    processed_data = []
     hourly_data = data["hourly"]
-    now = datetime.datetime.now()
-
-    # APIから取得した時間データを処理
-    for i, time in enumerate(hourly_data["time"]):
-        current_datetime = datetime.datetime.fromisoformat(time)
-        current_date = current_datetime.date()
-        
-        # 現在の時刻を超えるデータを除外
-        if current_datetime > now:
-            break
-        if current_date > end_date:
-            break
-
-        weather_info = {
-            "date": current_date.isoformat(),
-            "time": time.split("T")[1],
-            "weather_code": hourly_data["weathercode"][i],
-            "temperature_2m": hourly_data["temperature_2m"][i],
-            "precipitation": hourly_data["precipitation"][i],
-            "windspeed_10m": hourly_data["windspeed_10m"][i]
-        }
-        processed_data.append(weather_info)
+    times = hourly_data["time"]
+    # 時刻は "YYYY-MM-DDTHH:MM" 形式で昇順のため、文字列のまま二分探索で打ち切り位置を求める
+    now_str = datetime.datetime.now().isoformat(timespec="minutes")
+    cutoff = min(now_str, f"{end_date.isoformat()}T23:59")
+    count = bisect.bisect_right(times, cutoff)
 
-    return processed_data
+    # 現在の時刻・終了日を超えるデータを除外し、列ごとにまとめて処理
+    return [
+        {
+            "date": time[:10],
+            "time": time[11:],
+            "weather_code": weather_code,
+            "temperature_2m": temperature,
+            "precipitation": precipitation,
+            "windspeed_10m": windspeed
+        }
+        for time, weather_code, temperature, precipitation, windspeed in zip(
+            times[:count],
+            hourly_data["weathercode"],
+            hourly_data["temperature_2m"],
+            hourly_data["precipitation"],
+            hourly_data["windspeed_10m"]
+        )
+    ]
 
 # コンソールに天気情報を出力
 def print_console_output(weather_data: List[Dict[str, Any]], daily: bool = True):
     daily_data = {}
-    for item in weather_data:
-        date = item["date"]
-        # 日ごとの天気データを集計
-        if date not in daily_data:
-            daily_data[date] = {
-                "weather_code": item["weather_code"],
-                "max_temp": item["temperature_2m"],
-                "min_temp": item["temperature_2m"],
-                "total_precipitation": item["precipitation"],
-                "max_wind_speed": item["windspeed_10m"]
-            }
-        # 同じ日付の既存のデータを更新
-        else:
-            daily_data[date]["max_temp"] = max(daily_data[date]["max_temp"], item["temperature_2m"])
-            daily_data[date]["min_temp"] = min(daily_data[date]["min_temp"], item["temperature_2m"])
-            daily_data[date]["total_precipitation"] += item["precipitation"]
-            daily_data[date]["max_wind_speed"] = max(daily_data[date]["max_wind_speed"], item["windspeed_10m"])
-
-    # コンソールでの表示項目
-    for date, info in daily_data.items():
-        print(f"{date}: 天気コード {info['weather_code']}, "
-            f"最高気温 {info['max_temp']}°C, "
-            f"最低気温 {info['min_temp']}°C, "
-            f"降水量 {info['total_precipitation']:.1f}mm, "
-            f"最大風速 {info['max_wind_speed']}m/s")
+    # 日ごとの天気データを集計 (データは時刻順のため、日付ごとにまとめて処理)
+    for date, items in itertools.groupby(weather_data, key=operator.itemgetter("date")):
+        items = list(items)
+        temperatures = [item["temperature_2m"] for item in items]
+        daily_data[date] = {
+            "weather_code": items[0]["weather_code"],
+            "max_temp": max(temperatures),
+            "min_temp": min(temperatures),
+            "total_precipitation": sum(item["precipitation"] for item in items),
+            "max_wind_speed": max(item["windspeed_10m"] for item in items)
+        }
+
+    # コンソールでの表示項目 (まとめて一度に出力)
+    lines = [
+        f"{date}: 天気コード {info['weather_code']}, "
+        f"最高気温 {info['max_temp']}°C, "
+        f"最低気温 {info['min_temp']}°C, "
+        f"降水量 {info['total_precipitation']:.1f}mm, "
+        f"最大風速 {info['max_wind_speed']}m/s"
+        for date, info in daily_data.items()
+    ]
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 # CSV形式で天気情報を出力
 def write_csv_output(weather_data: List[Dict[str, Any]], columns: List[str] = None, csvfile=sys.stdout):
     if not columns:
-        columns = ["date", "time", "weather_code", "temperature_2m", "precipitation", "windspeed_10m"]
+        columns = DEFAULT_CSV_COLUMNS
+    validate_columns(columns)
 
-    translated_columns = [HEADER_TRANSLATION.get(col, col) for col in columns]
+    import csv
+
+    # 各行から出力するカラムの値を取り出す (カラムが1つの場合もタプルで返す)
+    if len(columns) > 1:
+        get_row = operator.itemgetter(*columns)
+    else:
+        get_row = lambda item, col=columns[0]: (item[col],)
 
     # CSVファイルへのデータ書き込み
     try:
-        writer = csv.DictWriter(csvfile, fieldnames=translated_columns, quoting=csv.QUOTE_MINIMAL)
-        writer.writeheader()
-        for item in weather_data:
-            translated_item = {HEADER_TRANSLATION.get(k, k): v for k, v in item.items() if k in columns}
-            writer.writerow(translated_item)
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow([HEADER_TRANSLATION[col] for col in columns])
+        writer.writerows(map(get_row, weather_data))
     except csv.Error as e:
         print(f"CSV出力エラー: {e}")
         sys.exit(1)
@@ -147,10 +238,11 @@ def write_csv_output(weather_data: List[Dict[str, Any]], columns: List[str] = No
 def validate_date(date_str):
     try:
         start_date = end_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        if start_date > TODAY:
+        today = datetime.date.today()
+        if start_date > today:
             print("無効な日付です。本日以前の日付を入力してください。")
             sys.exit(1)
-        if start_date < FOUR_MONTHS_AGO:
+        if start_date < today - datetime.timedelta(days=FOUR_MONTHS_DAYS):
             print("無効な日付です。過去4ヶ月以内の日付を入力してください。")
             sys.exit(1)
         return start_date, end_date
@@ -160,27 +252,35 @@ def validate_date(date_str):
 
 # CSVファイルの保存先とファイル名を生成
 def generate_csv_filename(args, start_date, end_date):
+    from pathlib import Path
+
     desktop_path = Path.home() / "Desktop"
     data_folder = desktop_path / "data"
     data_folder.mkdir(exist_ok=True)
 
     # ファイル名
     if args.date:
-        base_filename = f"weather_data_{args.date}.csv"
+        stem = f"weather_data_{args.date}"
     else:
-        base_filename = f"weather_data_{start_date.isoformat()}_{end_date.isoformat()}.csv"
-    
-    csv_filename = data_folder / base_filename
+        stem = f"weather_data_{start_date.isoformat()}_{end_date.isoformat()}"
+
+    # 既存のファイル名を一度にまとめて取得し、同名ファイルがある場合は連番を付与
+    with os.scandir(data_folder) as entries:
+        existing_names = {entry.name for entry in entries}
+
+    filename = f"{stem}.csv"
     counter = 1
-    while csv_filename.exists():
-        # 日付を指定している場合
-        if args.date:
-            csv_filename = data_folder / f"weather_data_{args.date}_{counter}.csv"
-        # 日付を指定していない場合
-        else:
-            csv_filename = data_folder / f"weather_data_{start_date.isoformat()}_{end_date.isoformat()}_{counter}.csv"
+    while filename in existing_names:
+        filename = f"{stem}_{counter}.csv"
         counter += 1
-    return csv_filename
+    return data_folder / filename
+
+# 存在しないカラムが指定された場合エラー文
+def validate_columns(columns):
+    invalid_columns = [col for col in columns if col not in HEADER_TRANSLATION]
+    if invalid_columns:
+        print(f"無効なカラムです: {', '.join(invalid_columns)}")
+        sys.exit(1)
 
 # 無効な入力の場合エラー文
 def validate_args(args):
@@ -188,12 +288,15 @@ def validate_args(args):
     if args.date in invalid_options:
         print("無効なオプションです。'--csv'と入力してください。")
         sys.exit(1)
+    if args.columns:
+        validate_columns(args.columns)
 
 # 日付範囲を決定
 def get_date_range(args):
     if args.date:
         return validate_date(args.date)
-    return TWO_WEEKS_AGO, TODAY
+    today = datetime.date.today()
+    return today - datetime.timedelta(days=TWO_WEEKS_DAYS), today
 
 # 天気データの取得、処理、出力
 def process_and_output_data(args, start_date, end_date):
@@ -210,7 +313,7 @@ def process_and_output_data(args, start_date, end_date):
 # 処理された天気データをCSVファイルとして出力するための処理
 def output_csv(args, start_date, end_date, processed_data):
     csv_filename = generate_csv_filename(args, start_date, end_date)
-    with open(csv_filename, 'w', newline='') as csvfile:
+    with open(csv_filename, 'w', newline='', buffering=CSV_BUFFER_SIZE, encoding='utf-8-sig') as csvfile:
         write_csv_output(processed_data, args.columns, csvfile)
     print(f"CSVファイルが作成されました: {os.path.abspath(csv_filename)}")
 